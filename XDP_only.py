@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 from bcc import BPF
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pandas as pd
-import time, psutil
+import time
+from bpf_stats import enable_bpf_stats, ProgRunStats
 
 bpf_program = r"""
 #include <uapi/linux/bpf.h>
 #include <linux/if_ether.h>
 
+#ifndef likely
+#define likely(x) __builtin_expect(!!(x), 1)
+#endif
+
 // ----------------- SHIM IPv4 -----------------
 struct iphdr {
     __u8 ihl:4;
@@ -49,14 +56,18 @@ struct tcphdr {
 #define TIME_WINDOW_NS 2000000000ULL
 #define THRESHOLD 10
 #define NEXTHDR_TCP 6
+#define TCP_FLAG_SYN 0x02
+#define TCP_FLAG_ACK 0x10
+#define MAX_ENTRIES 16384
 
 struct rate_val {
     __u64 last_ts;
     __u64 count;
 };
 
-BPF_HASH(rate_limit_map, u32, struct rate_val, 16384);
-BPF_ARRAY(stats_map, u64, 2);  // [0] = total SYN, [1] = dropped SYN
+// Condivisa tra le CPU: RSS distribuisce i SYN di una sorgente su piu' code RX
+BPF_TABLE("lru_hash", u32, struct rate_val, rate_limit_map, MAX_ENTRIES);
+BPF_PERCPU_ARRAY(stats_map, u64, 2);  // [0] = total SYN, [1] = dropped SYN
 
 static __always_inline int check_rate_limit(u32 src_ip) {
     u64 now = bpf_ktime_get_ns();
@@ -70,12 +81,10 @@ static __always_inline int check_rate_limit(u32 src_ip) {
     if (now - rv->last_ts > TIME_WINDOW_NS) {
         rv->last_ts = now;
         rv->count = 1;
-        rate_limit_map.update(&src_ip, rv);
         return 0;
     }
 
-    rv->count++;
-    rate_limit_map.update(&src_ip, rv);
+    __sync_fetch_and_add(&rv->count, 1);
 
     if (rv->count > THRESHOLD)
         return 1;
@@ -101,20 +110,26 @@ int xdp_simple_firewall(struct xdp_md *ctx) {
     if (iph->protocol != NEXTHDR_TCP)
         return XDP_PASS;
 
-    struct tcphdr *tcph = (void*)iph + iph->ihl*4;
+    // Fast path per header IPv4 senza opzioni (ihl == 5)
+    unsigned int thoff = likely(iph->ihl == 5) ? sizeof(*iph) : iph->ihl*4;
+    struct tcphdr *tcph = (void*)iph + thoff;
     if ((void*)(tcph+1) > data_end)
         return XDP_PASS;
 
+    // SYN senza ACK: un solo load del byte dei flag (offset 13) e un confronto
+    __u8 tflags = *((__u8 *)tcph + 13);
+    int is_syn = (tflags & (TCP_FLAG_SYN | TCP_FLAG_ACK)) == TCP_FLAG_SYN;
+
     // Update total SYN counter
-    if (tcph->syn && !tcph->ack) {
+    if (is_syn) {
         u32 key_total = 0;
         u64 *val_total = stats_map.lookup(&key_total);
         if (val_total)
-            __sync_fetch_and_add(val_total, 1);
+            (*val_total)++;
     }
 
     // Rate limit only SYN packets
-    if (tcph->syn && !tcph->ack) {
+    if (is_syn) {
         u32 src_ip = iph->saddr;
         
         if (check_rate_limit(src_ip)) {
@@ -122,7 +137,7 @@ int xdp_simple_firewall(struct xdp_md *ctx) {
             u32 key_drop = 1;
             u64 *val_drop = stats_map.lookup(&key_drop);
             if (val_drop)
-                __sync_fetch_and_add(val_drop, 1);
+                (*val_drop)++;
                 
             return XDP_DROP;
         }
@@ -135,6 +150,7 @@ int xdp_simple_firewall(struct xdp_md *ctx) {
 # -----------------------------------------------
 # Caricamento su interfaccia
 iface = "wlp3s0"  # cambia con la tua interfaccia reale
+stats_fd = enable_bpf_stats()
 b = BPF(text=bpf_program)
 fn = b.load_func("xdp_simple_firewall", BPF.XDP)
 b.attach_xdp(iface, fn, 0)
@@ -146,10 +162,12 @@ timestamps = []
 syn_totals = []
 syn_drops = []
 cpu_usages = []
+ns_per_pkts = []
 pps_rates = []
 
 prev_total = 0
 prev_drop = 0
+run_stats = ProgRunStats(fn.fd, stats_fd)
 start_time = time.time()
 
 try:
@@ -157,12 +175,12 @@ try:
         time.sleep(1)
         now = time.time() - start_time
 
-        # CPU usage
-        cpu_usage = psutil.cpu_percent(interval=None)
+        # Costo XDP misurato dal kernel: ns/pacchetto e quota di CPU
+        ns_per_pkt, cpu_usage = run_stats.sample()
 
-        # Lettura contatori BPF
-        total_syn = b["stats_map"][0].value
-        dropped_syn = b["stats_map"][1].value
+        # Lettura contatori BPF (ogni lookup per-CPU legge tutte le CPU)
+        total_syn = b["stats_map"].sum(0).value
+        dropped_syn = b["stats_map"].sum(1).value
 
         # Calcolo PPS
         delta_total = total_syn - prev_total
@@ -174,9 +192,10 @@ try:
         syn_totals.append(total_syn)
         syn_drops.append(dropped_syn)
         cpu_usages.append(cpu_usage)
+        ns_per_pkts.append(ns_per_pkt)
         pps_rates.append(pps)
 
-        print(f"Time: {now:.1f}s | SYN Total: {total_syn} | SYN Drop: {dropped_syn} | CPU: {cpu_usage}% | PPS: {pps}")
+        print(f"Time: {now:.1f}s | SYN Total: {total_syn} | SYN Drop: {dropped_syn} | XDP CPU: {cpu_usage}% | {ns_per_pkt:.0f} ns/pkt | PPS: {pps}")
 
 except KeyboardInterrupt:
     print("Rimozione XDP...")
@@ -187,16 +206,17 @@ except KeyboardInterrupt:
     success_rate = (accepted / syn_totals[-1] * 100) if syn_totals[-1] > 0 else 0
 
     df = pd.DataFrame({
-        "Metric": ["SYN Total", "SYN Blocked", "SYN Accepted", "Success Rate (%)", "Avg CPU (%)", "Avg PPS"],
+        "Metric": ["SYN Total", "SYN Blocked", "SYN Accepted", "Success Rate (%)", "Avg XDP CPU (%)", "Avg ns/pkt", "Avg PPS"],
         "Value": [syn_totals[-1], syn_drops[-1], accepted, success_rate,
-                 sum(cpu_usages)/len(cpu_usages), sum(pps_rates)/len(pps_rates)]
+                 sum(cpu_usages)/len(cpu_usages), run_stats.avg_ns_per_pkt(),
+                 sum(pps_rates)/len(pps_rates)]
     })
 
     print("\n=== XDP-only Results ===")
     print(df.to_string(index=False))
 
     # Grafici
-    plt.figure()
+    plt.figure(dpi=80)
     plt.plot(timestamps, syn_totals, label="SYN Total")
     plt.plot(timestamps, syn_drops, label="SYN Blocked")
     plt.xlabel("Time (s)")
@@ -205,20 +225,19 @@ except KeyboardInterrupt:
     plt.legend()
     plt.savefig("xdp_only_syn_over_time.png")
 
-    plt.figure()
-    plt.plot(timestamps, cpu_usages, label="CPU Usage (%)")
-    plt.xlabel("Time (s)")
-    plt.ylabel("CPU %")
-    plt.title("XDP-only: CPU Usage Over Time")
-    plt.legend()
-    plt.savefig("xdp_only_cpu_usage.png")
+    if run_stats.valid:
+        plt.figure(dpi=80)
+        plt.plot(timestamps, ns_per_pkts, label="XDP run time (ns/pkt)")
+        plt.xlabel("Time (s)")
+        plt.ylabel("ns/pkt")
+        plt.title("XDP-only: XDP Cost per Packet")
+        plt.legend()
+        plt.savefig("xdp_only_ns_per_packet.png")
 
-    plt.figure()
+    plt.figure(dpi=80)
     plt.plot(timestamps, pps_rates, label="Packets/s")
     plt.xlabel("Time (s)")
     plt.ylabel("PPS")
     plt.title("XDP-only: Throughput (SYN/sec)")
     plt.legend()
     plt.savefig("xdp_only_throughput.png")
-
-    plt.show()
\ No newline at end of file
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Statistiche di esecuzione dei programmi BPF (run_time_ns/run_cnt) via bpf(2)"""
+import ctypes as ct
+import os, platform, time
+
+# Numero della syscall bpf(2) per architettura
+NR_BPF_BY_ARCH = {"x86_64": 321, "aarch64": 280}
+BPF_OBJ_GET_INFO_BY_FD = 15
+BPF_ENABLE_STATS = 32
+BPF_STATS_RUN_TIME = 0
+
+libc = ct.CDLL(None, use_errno=True)
+libc.syscall.restype = ct.c_long
+
+class bpf_prog_info(ct.Structure):
+    # Layout di struct bpf_prog_info (uapi/linux/bpf.h) fino a run_cnt
+    _fields_ = [
+        ("type", ct.c_uint32), ("id", ct.c_uint32), ("tag", ct.c_uint8 * 8),
+        ("jited_prog_len", ct.c_uint32), ("xlated_prog_len", ct.c_uint32),
+        ("jited_prog_insns", ct.c_uint64), ("xlated_prog_insns", ct.c_uint64),
+        ("load_time", ct.c_uint64), ("created_by_uid", ct.c_uint32),
+        ("nr_map_ids", ct.c_uint32), ("map_ids", ct.c_uint64),
+        ("name", ct.c_char * 16), ("ifindex", ct.c_uint32),
+        ("gpl_compatible", ct.c_uint32), ("netns_dev", ct.c_uint64),
+        ("netns_ino", ct.c_uint64), ("nr_jited_ksyms", ct.c_uint32),
+        ("nr_jited_func_lens", ct.c_uint32), ("jited_ksyms", ct.c_uint64),
+        ("jited_func_lens", ct.c_uint64), ("btf_id", ct.c_uint32),
+        ("func_info_rec_size", ct.c_uint32), ("func_info", ct.c_uint64),
+        ("nr_func_info", ct.c_uint32), ("nr_line_info", ct.c_uint32),
+        ("line_info", ct.c_uint64), ("jited_line_info", ct.c_uint64),
+        ("nr_jited_line_info", ct.c_uint32), ("line_info_rec_size", ct.c_uint32),
+        ("jited_line_info_rec_size", ct.c_uint32), ("nr_prog_tags", ct.c_uint32),
+        ("prog_tags", ct.c_uint64), ("run_time_ns", ct.c_uint64), ("run_cnt", ct.c_uint64),
+    ]
+
+class bpf_info_attr(ct.Structure):
+    _fields_ = [("bpf_fd", ct.c_uint32), ("info_len", ct.c_uint32), ("info", ct.c_uint64)]
+
+def bpf_syscall(cmd, attr):
+    nr_bpf = NR_BPF_BY_ARCH.get(platform.machine())
+    if nr_bpf is None:
+        raise OSError(f"numero della syscall bpf sconosciuto per {platform.machine()}")
+    return libc.syscall(nr_bpf, cmd, ct.byref(attr), ct.sizeof(attr))
+
+def enable_bpf_stats():
+    # Le statistiche restano attive finche' il fd ritornato e' aperto (Linux >= 5.8)
+    try:
+        fd = bpf_syscall(BPF_ENABLE_STATS, ct.c_uint32(BPF_STATS_RUN_TIME))
+    except OSError as e:
+        print(f"Statistiche BPF non disponibili: {e}")
+        return -1
+    if fd < 0:
+        print("BPF_ENABLE_STATS non disponibile: usare sysctl kernel.bpf_stats_enabled=1")
+    return fd
+
+def bpf_stats_sysctl_enabled():
+    try:
+        with open("/proc/sys/kernel/bpf_stats_enabled") as f:
+            return f.read().strip() == "1"
+    except OSError:
+        return False
+
+def read_prog_run_stats(prog_fd):
+    # (run_time_ns, run_cnt) cumulativi del programma
+    info = bpf_prog_info()
+    attr = bpf_info_attr(prog_fd, ct.sizeof(info), ct.addressof(info))
+    if bpf_syscall(BPF_OBJ_GET_INFO_BY_FD, attr) < 0:
+        err = ct.get_errno()
+        raise OSError(err, os.strerror(err))
+    return info.run_time_ns, info.run_cnt
+
+class ProgRunStats:
+    """ns/pacchetto e quota di CPU di un programma BPF tra due campioni"""
+
+    def __init__(self, prog_fd, stats_fd):
+        self.prog_fd = prog_fd
+        self.ncpu = os.cpu_count()
+        self._prev_run_time = self._prev_run_cnt = 0
+        self._prev_tick = time.time()
+        # Senza statistiche attive run_time_ns/run_cnt restano fermi a 0
+        self.valid = stats_fd >= 0 or bpf_stats_sysctl_enabled()
+        if self.valid:
+            try:
+                self._prev_run_time, self._prev_run_cnt = read_prog_run_stats(prog_fd)
+            except OSError as e:
+                print(f"Lettura statistiche BPF fallita: {e}")
+                self.valid = False
+        if not self.valid:
+            print("Statistiche BPF non attive: ns/pkt e CPU XDP non misurati")
+        self._start_run_time, self._start_run_cnt = self._prev_run_time, self._prev_run_cnt
+
+    def sample(self):
+        """Ritorna (ns/pkt, CPU XDP %); ns/pkt e' NaN nei tick senza pacchetti"""
+        if not self.valid:
+            return float("nan"), float("nan")
+        run_time, run_cnt = read_prog_run_stats(self.prog_fd)
+        tick = time.time()
+        delta_ns = run_time - self._prev_run_time
+        delta_cnt = run_cnt - self._prev_run_cnt
+        ns_per_pkt = delta_ns / delta_cnt if delta_cnt else float("nan")
+        cpu_usage = round(100.0 * delta_ns / ((tick - self._prev_tick) * 1e9 * self.ncpu), 2)
+        self._prev_run_time, self._prev_run_cnt, self._prev_tick = run_time, run_cnt, tick
+        return ns_per_pkt, cpu_usage
+
+    def avg_ns_per_pkt(self):
+        """ns/pkt medio pesato sui pacchetti, dai contatori cumulativi dall'avvio"""
+        delta_cnt = self._prev_run_cnt - self._start_run_cnt
+        if not self.valid or delta_cnt == 0:
+            return float("nan")
+        return (self._prev_run_time - self._start_run_time) / delta_cnt
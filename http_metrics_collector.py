@@ -4,27 +4,89 @@ HTTP Client Metrics Collector for DDoS Resilience Testing
 Measures service availability and performance during attack conditions
 """
 
-import requests
+import asyncio
+import httpx
+import numpy as np
 import time
-import statistics
 import csv
 import sys
 from datetime import datetime
 from urllib.parse import urlparse
 
+CSV_FLUSH_EVERY = 100  # rows buffered before flushing the CSV log
+INITIAL_CAPACITY = 1024  # preallocated samples, doubled when full
+MAX_RESERVE = 1 << 16  # cap on samples reserved up front from --requests
+NUMERIC_COLUMNS = ('timestamps', 'response_times', 'ttfb_values', 'status_codes')
+
+# Non-interactive backend: plots are only written to PNG
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+# Numba (optional) JIT-compiles the rolling mean for long runs
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# HTTP/2 in httpx needs the optional 'h2' package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+def _rolling_mean_numpy(values, window):
+    """Trailing mean over [i - window, i] via prefix sums"""
+    csum = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(0, end - 1 - window)
+    return (csum[end] - csum[start]) / (end - start)
+
+def _rolling_mean_loop(values, window):
+    """Trailing mean over [i - window, i] with a running sum"""
+    out = np.empty(values.shape[0], dtype=np.float64)
+    acc = 0.0
+    for i in range(values.shape[0]):
+        acc += values[i]
+        if i > window:
+            acc -= values[i - window - 1]
+        out[i] = acc / (min(i, window) + 1)
+    return out
+
+rolling_mean = njit(cache=True, fastmath=True)(_rolling_mean_loop) if njit else _rolling_mean_numpy
+
+def p95_exclusive(values):
+    """Same result as statistics.quantiles(values, n=20)[-1] (exclusive method)"""
+    ld = len(values)
+    m = ld + 1
+    j = min(max(19 * m // 20, 1), ld - 1)
+    delta = 19 * m - j * 20
+    # Only the j-th and (j+1)-th order statistics are needed
+    lo, hi = np.partition(values, [j - 1, j])[[j - 1, j]]
+    return (lo * (20 - delta) + hi * delta) / 20
+
 class HTTPMetricsCollector:
-    def __init__(self, target_url, interval=1.0, timeout=5.0):
+    def __init__(self, target_url, interval=1.0, timeout=5.0, concurrency=1, http2=False):
         self.target_url = target_url
         self.interval = interval
         self.timeout = timeout
+        self.concurrency = concurrency
+        self.http2 = http2
+        
+        # Numeric columns are preallocated arrays filled up to n_samples
+        self.n_samples = 0
         self.metrics = {
-            'timestamps': [],
-            'response_times': [],
-            'status_codes': [],
+            'timestamps': np.empty(INITIAL_CAPACITY, dtype=np.int64),  # time.time_ns()
+            'response_times': np.empty(INITIAL_CAPACITY, dtype=np.float32),
+            'status_codes': np.empty(INITIAL_CAPACITY, dtype=np.int16),
             'successful_requests': 0,
             'failed_requests': 0,
             'timeout_requests': 0,
-            'ttfb_values': []  # Time To First Byte
+            'ttfb_values': np.empty(INITIAL_CAPACITY, dtype=np.float32)  # Time To First Byte
         }
         
         # CSV logging setup
@@ -32,24 +94,32 @@ class HTTPMetricsCollector:
         self.setup_csv_log()
         
     def setup_csv_log(self):
-        """Initialize CSV file with headers"""
-        with open(self.csv_file, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([
-                'timestamp', 'response_time_ms', 'status_code', 
-                'success', 'ttfb_ms', 'bytes_received'
-            ])
+        """Initialize CSV file with headers and keep it open for logging"""
+        self._csv_fh = open(self.csv_file, 'w', newline='', buffering=1 << 16)
+        self._csv_writer = csv.writer(self._csv_fh)
+        self._csv_rows = 0
+        self._csv_writer.writerow([
+            'timestamp', 'response_time_ms', 'status_code', 
+            'success', 'ttfb_ms', 'bytes_received'
+        ])
     
-    def log_to_csv(self, timestamp, response_time, status_code, success, ttfb, bytes_len):
-        """Log individual request metrics to CSV"""
-        with open(self.csv_file, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([
-                timestamp, response_time, status_code, 
-                success, ttfb, bytes_len
-            ])
+    def log_to_csv(self, timestamp_ns, response_time, status_code, success, ttfb, bytes_len):
+        """Log individual request metrics to CSV (timestamp as Unix seconds)"""
+        seconds, micros = divmod(timestamp_ns // 1000, 1_000_000)
+        self._csv_writer.writerow([
+            f"{seconds}.{micros:06d}", response_time, status_code, 
+            success, ttfb, bytes_len
+        ])
+        self._csv_rows += 1
+        if self._csv_rows % CSV_FLUSH_EVERY == 0:
+            self._csv_fh.flush()
     
-    def make_request(self):
+    def close_csv_log(self):
+        """Flush and close the CSV log"""
+        if not self._csv_fh.closed:
+            self._csv_fh.close()
+    
+    async def make_request(self, client):
         """Make HTTP request and collect timing metrics"""
         start_time = time.time()
         success = False
@@ -60,24 +130,24 @@ class HTTPMetricsCollector:
         
         try:
             # Measure TTFB and total response time
-            with requests.get(self.target_url, timeout=self.timeout, stream=True) as response:
+            async with client.stream('GET', self.target_url) as response:
                 # Time to first byte
                 ttfb = (time.time() - start_time) * 1000
                 
                 # Read full response to get complete timing
-                content = response.content
+                content = await response.aread()
                 response_time = (time.time() - start_time) * 1000
                 
                 status_code = response.status_code
                 bytes_received = len(content)
                 success = (200 <= status_code < 400)
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             response_time = self.timeout * 1000
             success = False
             status_code = 0
             
-        except requests.exceptions.ConnectionError:
+        except httpx.TransportError:
             response_time = (time.time() - start_time) * 1000
             success = False
             status_code = 0
@@ -93,18 +163,72 @@ class HTTPMetricsCollector:
             'status_code': status_code,
             'ttfb': ttfb,
             'bytes_received': bytes_received,
-            'timestamp': datetime.now().isoformat()
+            'timestamp_ns': time.time_ns()
         }
     
+    def reserve(self, capacity):
+        """Grow the numeric metric columns to hold at least `capacity` samples"""
+        current = len(self.metrics['response_times'])
+        if capacity <= current:
+            return
+        capacity = max(capacity, 2 * current)
+        for name in NUMERIC_COLUMNS:
+            column = np.empty(capacity, dtype=self.metrics[name].dtype)
+            column[:self.n_samples] = self.metrics[name][:self.n_samples]
+            self.metrics[name] = column
+    
+    def record_result(self, result):
+        """Store a single request result and log it to CSV"""
+        i = self.n_samples
+        self.reserve(i + 1)
+        self.metrics['timestamps'][i] = result['timestamp_ns']
+        self.metrics['response_times'][i] = result['response_time']
+        self.metrics['status_codes'][i] = result['status_code']
+        self.metrics['ttfb_values'][i] = result['ttfb']
+        self.n_samples += 1
+        
+        if result['success']:
+            self.metrics['successful_requests'] += 1
+        else:
+            self.metrics['failed_requests'] += 1
+            if result['response_time'] >= self.timeout * 1000:
+                self.metrics['timeout_requests'] += 1
+        
+        self.log_to_csv(
+            result['timestamp_ns'],
+            result['response_time'],
+            result['status_code'],
+            int(result['success']),
+            result['ttfb'],
+            result['bytes_received']
+        )
+    
     def collect_metrics(self, duration_seconds=None, max_requests=None):
         """Main metrics collection loop"""
-        request_count = 0
-        start_time = time.time()
+        if max_requests:
+            self.reserve(min(max_requests, MAX_RESERVE))
         
         print(f"Starting HTTP metrics collection for {self.target_url}")
         print("Press Ctrl+C to stop early\n")
         
         try:
+            asyncio.run(self._collect_async(duration_seconds, max_requests))
+                
+        except KeyboardInterrupt:
+            print("\nCollection stopped by user")
+        
+        finally:
+            self.generate_summary_report()
+    
+    async def _collect_async(self, duration_seconds, max_requests):
+        """Issue `concurrency` parallel requests per interval over one client"""
+        request_count = 0
+        start_time = time.time()
+        limits = httpx.Limits(max_connections=max(100, self.concurrency),
+                             max_keepalive_connections=20)
+        
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout,
+                                     http2=self.http2) as client:
             while True:
                 # Check duration limit
                 if duration_seconds and (time.time() - start_time) > duration_seconds:
@@ -114,45 +238,24 @@ class HTTPMetricsCollector:
                 if max_requests and request_count >= max_requests:
                     break
                 
-                # Make request and collect metrics
-                result = self.make_request()
-                
-                # Store metrics
-                self.metrics['timestamps'].append(result['timestamp'])
-                self.metrics['response_times'].append(result['response_time'])
-                self.metrics['status_codes'].append(result['status_code'])
-                self.metrics['ttfb_values'].append(result['ttfb'])
-                
-                if result['success']:
-                    self.metrics['successful_requests'] += 1
-                else:
-                    self.metrics['failed_requests'] += 1
-                    if result['response_time'] >= self.timeout * 1000:
-                        self.metrics['timeout_requests'] += 1
-                
-                # Log to CSV
-                self.log_to_csv(
-                    result['timestamp'],
-                    result['response_time'],
-                    result['status_code'],
-                    int(result['success']),
-                    result['ttfb'],
-                    result['bytes_received']
+                # Launch this tick's requests concurrently
+                batch = self.concurrency
+                if max_requests:
+                    batch = min(batch, max_requests - request_count)
+                results = await asyncio.gather(
+                    *(self.make_request(client) for _ in range(batch))
                 )
                 
-                # Display progress
-                request_count += 1
-                if request_count % 10 == 0:
-                    self.display_progress()
+                for result in results:
+                    self.record_result(result)
+                    
+                    # Display progress
+                    request_count += 1
+                    if request_count % 10 == 0:
+                        self.display_progress()
                 
                 # Wait for next interval
-                time.sleep(self.interval)
-                
-        except KeyboardInterrupt:
-            print("\nCollection stopped by user")
-        
-        finally:
-            self.generate_summary_report()
+                await asyncio.sleep(self.interval)
     
     def display_progress(self):
         """Display current progress metrics"""
@@ -161,7 +264,7 @@ class HTTPMetricsCollector:
             return
             
         success_rate = (self.metrics['successful_requests'] / total) * 100
-        avg_response = statistics.mean(self.metrics['response_times']) if self.metrics['response_times'] else 0
+        avg_response = self.metrics['response_times'][:self.n_samples].mean(dtype=np.float64) if self.n_samples else 0
         
         print(f"[{datetime.now().strftime('%H:%M:%S')}] "
               f"Requests: {total} | "
@@ -170,7 +273,13 @@ class HTTPMetricsCollector:
     
     def generate_summary_report(self):
         """Generate comprehensive summary report"""
-        total_requests = len(self.metrics['response_times'])
+        self.close_csv_log()
+        
+        # Drop the unused preallocated capacity
+        for name in NUMERIC_COLUMNS:
+            self.metrics[name] = self.metrics[name][:self.n_samples]
+        
+        total_requests = self.n_samples
         if total_requests == 0:
             print("No requests were made")
             return
@@ -178,21 +287,23 @@ class HTTPMetricsCollector:
         success_rate = (self.metrics['successful_requests'] / total_requests) * 100
         timeout_rate = (self.metrics['timeout_requests'] / total_requests) * 100
         
-        # Calculate statistics
-        response_times = self.metrics['response_times']
-        ttfb_times = [t for t in self.metrics['ttfb_values'] if t > 0]
+        # Calculate statistics (vectorized)
+        response_times = np.asarray(self.metrics['response_times'], dtype=np.float64)
+        ttfb_times = np.asarray(self.metrics['ttfb_values'], dtype=np.float64)
+        ttfb_times = ttfb_times[ttfb_times > 0]
         
-        avg_response = statistics.mean(response_times) if response_times else 0
-        avg_ttfb = statistics.mean(ttfb_times) if ttfb_times else 0
+        avg_response = response_times.mean() if response_times.size else 0
+        avg_ttfb = ttfb_times.mean() if ttfb_times.size else 0
         
-        p95_response = statistics.quantiles(response_times, n=20)[-1] if len(response_times) > 1 else 0
-        p95_ttfb = statistics.quantiles(ttfb_times, n=20)[-1] if len(ttfb_times) > 1 else 0
+        p95_response = p95_exclusive(response_times) if response_times.size > 1 else 0
+        p95_ttfb = p95_exclusive(ttfb_times) if ttfb_times.size > 1 else 0
         
         print("\n" + "="*60)
         print("HTTP METRICS COLLECTION SUMMARY")
         print("="*60)
         print(f"Target URL: {self.target_url}")
-        print(f"Time period: {self.metrics['timestamps'][0]} to {self.metrics['timestamps'][-1]}")
+        first, last = (datetime.fromtimestamp(ns / 1e9).isoformat() for ns in self.metrics['timestamps'][[0, -1]])
+        print(f"Time period: {first} to {last}")
         print(f"Total requests: {total_requests}")
         print(f"Successful requests: {self.metrics['successful_requests']}")
         print(f"Failed requests: {self.metrics['failed_requests']}")
@@ -207,20 +318,24 @@ class HTTPMetricsCollector:
         print(f"Detailed metrics saved to: {self.csv_file}")
         
         # Generate a simple plot if matplotlib is available
-        try:
-            import matplotlib.pyplot as plt
+        if plt is not None:
             self.generate_plots()
-        except ImportError:
+        else:
             print("Matplotlib not available - skipping plots")
     
     def generate_plots(self):
         """Generate visualization plots"""
+        response_times = np.asarray(self.metrics['response_times'], dtype=np.float64)
+        # Downsample line plots to ~2000 points for long runs
+        step = max(1, len(response_times) // 2000)
+        request_numbers = np.arange(0, len(response_times), step)
+        
         # Response time over time
-        plt.figure(figsize=(12, 8))
+        plt.figure(figsize=(12, 8), dpi=80)
         
         # Plot 1: Response times
         plt.subplot(2, 2, 1)
-        plt.plot(self.metrics['response_times'])
+        plt.plot(request_numbers, response_times[::step])
         plt.title('Response Time Over Time')
         plt.xlabel('Request Number')
         plt.ylabel('Response Time (ms)')
@@ -228,14 +343,10 @@ class HTTPMetricsCollector:
         
         # Plot 2: Success rate rolling window
         plt.subplot(2, 2, 2)
-        window_size = min(50, len(self.metrics['response_times']) // 10)
-        success_rolling = []
-        for i in range(len(self.metrics['response_times'])):
-            start = max(0, i - window_size)
-            window = self.metrics['response_times'][start:i+1]
-            success_rolling.append(statistics.mean(window) if window else 0)
+        window_size = min(50, len(response_times) // 10)
+        success_rolling = rolling_mean(response_times, window_size)
         
-        plt.plot(success_rolling)
+        plt.plot(request_numbers, success_rolling[::step])
         plt.title(f'Rolling Avg Response Time (window={window_size})')
         plt.xlabel('Request Number')
         plt.ylabel('Response Time (ms)')
@@ -243,17 +354,16 @@ class HTTPMetricsCollector:
         
         # Plot 3: Status code distribution
         plt.subplot(2, 2, 3)
-        status_counts = {}
-        for code in self.metrics['status_codes']:
-            status_counts[code] = status_counts.get(code, 0) + 1
-        plt.bar([str(k) for k in status_counts.keys()], status_counts.values())
+        codes, counts = np.unique(self.metrics['status_codes'], return_counts=True)
+        plt.bar([str(k) for k in codes], counts)
         plt.title('HTTP Status Code Distribution')
         plt.xlabel('Status Code')
         plt.ylabel('Count')
         
         # Plot 4: TTFB distribution
         plt.subplot(2, 2, 4)
-        plt.hist([t for t in self.metrics['ttfb_values'] if t > 0], bins=20)
+        ttfb_values = np.asarray(self.metrics['ttfb_values'], dtype=np.float64)
+        plt.hist(ttfb_values[ttfb_values > 0], bins=20)
         plt.title('Time To First Byte Distribution')
         plt.xlabel('TTFB (ms)')
         plt.ylabel('Frequency')
@@ -278,6 +388,10 @@ def main():
                        help='Duration to run in seconds')
     parser.add_argument('--requests', '-r', type=int,
                        help='Maximum number of requests to make')
+    parser.add_argument('--concurrency', '-c', type=int, default=1,
+                       help='Concurrent requests per interval (default: 1)')
+    parser.add_argument('--http2', action='store_true',
+                       help='Negotiate HTTP/2 (requires the h2 package)')
     
     args = parser.parse_args()
     
@@ -286,10 +400,20 @@ def main():
         print("Error: URL must start with http:// or https://")
         sys.exit(1)
     
+    if args.concurrency < 1:
+        print("Error: --concurrency must be at least 1")
+        sys.exit(1)
+    
+    if args.http2 and not HTTP2_AVAILABLE:
+        print("Error: --http2 requires the 'h2' package (pip install httpx[http2])")
+        sys.exit(1)
+    
     collector = HTTPMetricsCollector(
         target_url=args.url,
         interval=args.interval,
-        timeout=args.timeout
+        timeout=args.timeout,
+        concurrency=args.concurrency,
+        http2=args.http2
     )
     
     collector.collect_metrics(
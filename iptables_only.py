@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
+import os
 import subprocess
 import time
-import psutil
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pandas as pd
 
+# python-iptables (opzionale): lettura contatori senza fork/exec
+try:
+    import iptc
+except ImportError:
+    iptc = None
+
 # Configurazione iptables
 def setup_iptables():
     """Configura le regole iptables per il rate limiting SYN"""
@@ -34,39 +42,98 @@ def cleanup_iptables():
     subprocess.run(["sudo", "iptables", "-X"], check=True)
 
 # Monitoraggio statistiche iptables
+_iptc_state = {"enabled": iptc is not None, "table": None, "accept_idx": None, "drop_idx": None}
+
+def find_syn_rules(chain):
+    """Individua la posizione delle regole SYN ACCEPT (limit) e DROP nella chain"""
+    accept_idx = drop_idx = None
+    for idx, rule in enumerate(chain.rules):
+        if rule.protocol != "tcp":
+            continue
+        if rule.target.name == "ACCEPT" and any(m.name == "limit" for m in rule.matches):
+            accept_idx = idx
+        elif rule.target.name == "DROP":
+            drop_idx = idx
+    return accept_idx, drop_idx
+
+def get_iptables_stats_iptc():
+    """Legge i contatori delle regole SYN direttamente da libiptc"""
+    state = _iptc_state
+    if state["table"] is None:
+        state["table"] = iptc.Table(iptc.Table.FILTER)
+        state["table"].autocommit = False
+        chain = iptc.Chain(state["table"], "INPUT")
+        state["accept_idx"], state["drop_idx"] = find_syn_rules(chain)
+        if state["accept_idx"] is None or state["drop_idx"] is None:
+            raise LookupError("regole SYN non trovate via libiptc")
+
+    # Un solo snapshot della tabella per tick
+    state["table"].refresh()
+    rules = iptc.Chain(state["table"], "INPUT").rules
+    syn_accept, _ = rules[state["accept_idx"]].get_counters()
+    syn_drop, _ = rules[state["drop_idx"]].get_counters()
+    return syn_accept, syn_drop
+
 def get_iptables_stats():
     """Legge le statistiche dalle regole iptables"""
+    if _iptc_state["enabled"]:
+        try:
+            return get_iptables_stats_iptc()
+        except (iptc.IPTCError, LookupError):
+            # Permessi insufficienti o backend nft: ripiego su iptables -L
+            _iptc_state["enabled"] = False
+
     try:
-        # Conta SYN accettati
-        result_accept = subprocess.run([
+        # Un solo listing per SYN accettati e droppati
+        result = subprocess.run([
             "sudo", "iptables", "-L", "INPUT", "-v", "-n", "-x"
         ], capture_output=True, text=True, check=True)
         
-        # Conta SYN droppati
-        result_drop = subprocess.run([
-            "sudo", "iptables", "-L", "INPUT", "-v", "-n", "-x"
-        ], capture_output=True, text=True, check=True)
-        
-        # Parsing output (semplificato)
-        lines = result_accept.stdout.split('\n')
+        # Parsing output (semplificato): colonna 0 = pkts, colonna 1 = bytes
+        lines = result.stdout.split('\n')
         syn_accept = 0
         syn_drop = 0
         
         for line in lines:
             if "limit" in line and "ACCEPT" in line and "tcp" in line:
                 parts = line.split()
-                if len(parts) > 1:
-                    syn_accept = int(parts[1])
-            elif "SYN" in line and "DROP" in line:
+                if parts:
+                    syn_accept = int(parts[0])
+            elif "DROP" in line and "tcp" in line:
                 parts = line.split()
-                if len(parts) > 1:
-                    syn_drop = int(parts[1])
+                if parts:
+                    syn_drop = int(parts[0])
         
         return syn_accept, syn_drop
         
     except subprocess.CalledProcessError:
         return 0, 0
 
+class ProcStatCPU:
+    """CPU di sistema (%) dai delta della riga aggregata 'cpu' di /proc/stat"""
+    
+    def __init__(self):
+        self._stat_fd = os.open("/proc/stat", os.O_RDONLY)
+        self._prev_busy, self._prev_total = self._read()
+    
+    def _read(self):
+        # Una pread dall'offset 0 rigenera il contenuto di /proc/stat
+        line = os.pread(self._stat_fd, 256, 0).split(b"\n", 1)[0]
+        # user nice system idle iowait irq softirq steal
+        values = [int(v) for v in line.split()[1:9]]
+        total = sum(values)
+        return total - values[3] - values[4], total
+    
+    def percent(self):
+        busy, total = self._read()
+        busy_d = busy - self._prev_busy
+        total_d = total - self._prev_total
+        self._prev_busy, self._prev_total = busy, total
+        return round(100.0 * busy_d / total_d, 1) if total_d > 0 else 0.0
+    
+    def close(self):
+        os.close(self._stat_fd)
+
 # Main monitoring
 def monitor_iptables():
     timestamps = []
@@ -77,6 +144,7 @@ def monitor_iptables():
     
     prev_accept = 0
     prev_drop = 0
+    cpu = ProcStatCPU()
     start_time = time.time()
     
     try:
@@ -87,7 +155,7 @@ def monitor_iptables():
             now = time.time() - start_time
             
             # CPU usage
-            cpu_usage = psutil.cpu_percent(interval=None)
+            cpu_usage = cpu.percent()
             
             # Get statistics
             syn_accept, syn_drop = get_iptables_stats()
@@ -112,6 +180,7 @@ def monitor_iptables():
             
     except KeyboardInterrupt:
         print("\nStopping monitoring...")
+        cpu.close()
         
         # Final statistics
         total_syn = syn_accepts[-1] + syn_drops[-1] if syn_accepts and syn_drops else 0
@@ -128,7 +197,7 @@ def monitor_iptables():
         print(df.to_string(index=False))
         
         # Plots
-        plt.figure()
+        plt.figure(dpi=80)
         plt.plot(timestamps, [a+d for a,d in zip(syn_accepts, syn_drops)], label="SYN Total")
         plt.plot(timestamps, syn_drops, label="SYN Blocked")
         plt.xlabel("Time (s)")
@@ -137,7 +206,7 @@ def monitor_iptables():
         plt.legend()
         plt.savefig("iptables_syn_over_time.png")
         
-        plt.figure()
+        plt.figure(dpi=80)
         plt.plot(timestamps, cpu_usages, label="CPU Usage (%)")
         plt.xlabel("Time (s)")
         plt.ylabel("CPU %")
@@ -145,15 +214,13 @@ def monitor_iptables():
         plt.legend()
         plt.savefig("iptables_cpu_usage.png")
         
-        plt.figure()
+        plt.figure(dpi=80)
         plt.plot(timestamps, pps_rates, label="Packets/s")
         plt.xlabel("Time (s)")
         plt.ylabel("PPS")
         plt.title("iptables-only: Throughput (SYN/sec)")
         plt.legend()
         plt.savefig("iptables_throughput.png")
-        
-        plt.show()
 
 if __name__ == "__main__":
     try:
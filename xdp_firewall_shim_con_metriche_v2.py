@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 from bcc import BPF
+from collections import Counter
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pandas as pd
-import time, psutil
+import platform, re, socket, struct, time
+from bpf_stats import enable_bpf_stats, ProgRunStats
 
 bpf_program = r"""
 #include <uapi/linux/bpf.h>
 #include <linux/if_ether.h>
 
+#ifndef likely
+#define likely(x) __builtin_expect(!!(x), 1)
+#endif
+
 // ----------------- SHIM IPv4 -----------------
 struct iphdr {
     __u8 ihl:4;
@@ -49,15 +57,50 @@ struct tcphdr {
 #define TIME_WINDOW_NS 2000000000ULL
 #define THRESHOLD 10
 #define NEXTHDR_TCP 6
+#define TCP_FLAG_SYN 0x02
+#define TCP_FLAG_ACK 0x10
+#define MAX_ENTRIES 16384
 
 struct rate_val {
     __u64 last_ts;
     __u64 count;
 };
 
-BPF_HASH(rate_limit_map, u32, struct rate_val, 16384);
-BPF_HASH(ip_blocked_map, u32, u64, 16384);
-BPF_ARRAY(stats_map, u64, 1);
+// Condivisa tra le CPU: RSS distribuisce i SYN di una sorgente su piu' code RX
+BPF_TABLE("lru_hash", u32, struct rate_val, rate_limit_map, MAX_ENTRIES);
+BPF_TABLE("lru_hash", u32, u8, ip_blocked_map, MAX_ENTRIES);
+BPF_PERCPU_ARRAY(stats_map, u64, 2);  // [0] = total SYN, [1] = blocked IP
+
+// ----------------- EVENTI SYN -----------------
+#define RINGBUF_PAGES 8
+#define RINGBUF_HIGH_WMARK (RINGBUF_PAGES * 4096 * 3 / 4)  // 75% del ring
+#define SAMPLE_MASK 0x3F  // un evento ogni 64 SYN per CPU
+#define EVT_SYN 0x1
+#define EVT_BLOCKED 0x2
+
+struct evt {
+    u32 ip;
+    u32 flags;
+};
+
+#ifdef USE_RINGBUF
+BPF_RINGBUF_OUTPUT(events, RINGBUF_PAGES);
+#else
+BPF_PERF_OUTPUT(events);
+#endif
+BPF_PERCPU_ARRAY(sample_ctr, u64, 1);
+
+static __always_inline void emit_event(struct xdp_md *ctx, u32 src_ip, u32 flags, u64 wakeup) {
+    struct evt e = { .ip = src_ip, .flags = flags };
+#ifdef USE_RINGBUF
+    // Scarta l'evento se il consumer e' in ritardo
+    if (events.ringbuf_query(BPF_RB_AVAIL_DATA) > RINGBUF_HIGH_WMARK)
+        return;
+    events.ringbuf_output(&e, sizeof(e), wakeup);
+#else
+    events.perf_submit(ctx, &e, sizeof(e));
+#endif
+}
 
 static __always_inline int check_rate_limit(u32 src_ip) {
     u64 now = bpf_ktime_get_ns();
@@ -71,12 +114,10 @@ static __always_inline int check_rate_limit(u32 src_ip) {
     if (now - rv->last_ts > TIME_WINDOW_NS) {
         rv->last_ts = now;
         rv->count = 1;
-        rate_limit_map.update(&src_ip, rv);
         return 0;
     }
 
-    rv->count++;
-    rate_limit_map.update(&src_ip, rv);
+    __sync_fetch_and_add(&rv->count, 1);
 
     if (rv->count > THRESHOLD)
         return 1;
@@ -102,33 +143,48 @@ int xdp_firewall(struct xdp_md *ctx) {
     if (iph->protocol != NEXTHDR_TCP)
         return XDP_PASS;
 
-    struct tcphdr *tcph = (void*)iph + iph->ihl*4;
+    // Fast path per header IPv4 senza opzioni (ihl == 5)
+    unsigned int thoff = likely(iph->ihl == 5) ? sizeof(*iph) : iph->ihl*4;
+    struct tcphdr *tcph = (void*)iph + thoff;
     if ((void*)(tcph+1) > data_end)
         return XDP_PASS;
 
-    u32 src_ip = iph->saddr;
+    // SYN senza ACK: un solo load del byte dei flag (offset 13) e un confronto
+    __u8 tflags = *((__u8 *)tcph + 13);
+    int is_syn = (tflags & (TCP_FLAG_SYN | TCP_FLAG_ACK)) == TCP_FLAG_SYN;
 
-    // Log SYN
-    if (tcph->syn && !tcph->ack)
-        bpf_trace_printk("SYN ricevuto da IP: %x\n", src_ip);
+    // Solo i SYN vengono contati, campionati e sottoposti a rate-limit
+    if (!is_syn)
+        return XDP_PASS;
+
+    u32 src_ip = iph->saddr;
 
     // Aggiorna contatore globale SYN
     u32 key = 0;
     u64 *val = stats_map.lookup(&key);
     if (val)
-        __sync_fetch_and_add(val, 1);
+        (*val)++;
+
+    // Log SYN campionato
+    u64 *ctr = sample_ctr.lookup(&key);
+    if (ctr && ((*ctr)++ & SAMPLE_MASK) == 0)
+        emit_event(ctx, src_ip, EVT_SYN, BPF_RB_NO_WAKEUP);
 
     // Gestione SYN con rate-limit e blocco
-    if (tcph->syn && !tcph->ack) {
-        u64 *blocked = ip_blocked_map.lookup(&src_ip);
-        if (blocked)
-            return XDP_DROP;
-
-        if (check_rate_limit(src_ip)) {
-            u64 one = 1;
-            ip_blocked_map.update(&src_ip, &one);
-            return XDP_DROP;
-        }
+    u8 *blocked = ip_blocked_map.lookup(&src_ip);
+    if (blocked)
+        return XDP_DROP;
+
+    if (check_rate_limit(src_ip)) {
+        u8 one = 1;
+        ip_blocked_map.update(&src_ip, &one);
+
+        u32 key_blocked = 1;
+        u64 *val_blocked = stats_map.lookup(&key_blocked);
+        if (val_blocked)
+            (*val_blocked)++;
+        emit_event(ctx, src_ip, EVT_SYN | EVT_BLOCKED, BPF_RB_FORCE_WAKEUP);
+        return XDP_DROP;
     }
 
     return XDP_PASS;
@@ -136,12 +192,39 @@ int xdp_firewall(struct xdp_md *ctx) {
 """
 
 # -----------------------------------------------
+# Ring buffer disponibile da Linux 5.8, altrimenti perf buffer
+kernel_version = tuple(int(x) for x in re.findall(r"\d+", platform.release())[:2])
+USE_RINGBUF = kernel_version >= (5, 8)
+
 # Caricamento su interfaccia
 iface = "wlp3s0"  # cambia con la tua interfaccia reale
-b = BPF(text=bpf_program)
+stats_fd = enable_bpf_stats()
+b = BPF(text=bpf_program, cflags=["-DUSE_RINGBUF"] if USE_RINGBUF else [])
 fn = b.load_func("xdp_firewall", BPF.XDP)
 b.attach_xdp(iface, fn, 0)
 
+# Consumo eventi SYN (campionati 1/64) e blocchi
+EVT_BLOCKED = 0x2
+syn_sources = Counter()
+blocked_events = 0  # solo contatore: gli IP restano in ip_blocked_map
+
+def ip_to_str(ip):
+    return socket.inet_ntoa(struct.pack('=I', ip))
+
+def handle_syn_event(ctx, data, size):
+    global blocked_events
+    event = b["events"].event(data)
+    if event.flags & EVT_BLOCKED:
+        blocked_events += 1
+    else:
+        syn_sources[event.ip] += 1
+
+if USE_RINGBUF:
+    b["events"].open_ring_buffer(handle_syn_event)
+else:
+    # Notifica campionata: wakeup ogni 64 eventi invece che a ogni evento
+    b["events"].open_perf_buffer(handle_syn_event, wakeup_events=64)
+
 print(f"XDP Firewall attivo su {iface}. Ctrl-C per terminare...")
 
 # Collezione metriche runtime
@@ -149,23 +232,40 @@ timestamps = []
 syn_counts = []
 blocked_counts = []
 cpu_usages = []
+ns_per_pkts = []
 pps_rates = []
 
 prev_syn = 0
+run_stats = ProgRunStats(fn.fd, stats_fd)
 start_time = time.time()
+next_sample = start_time + 1
 
 try:
     while True:
-        time.sleep(1)  # campionamento ogni secondo
+        # Attesa in epoll fino al prossimo campione: i blocchi (FORCE_WAKEUP)
+        # vengono gestiti appena arrivano, il campionamento resta a 1 Hz
+        timeout_ms = max(0, int((next_sample - time.time()) * 1000))
+        if USE_RINGBUF:
+            b.ring_buffer_poll(timeout=timeout_ms)
+        else:
+            b.perf_buffer_poll(timeout=timeout_ms)
+        if time.time() < next_sample:
+            continue
+        next_sample += 1  # campionamento ogni secondo
         now = time.time() - start_time
 
-        # CPU usage (process wide)
-        cpu_usage = psutil.cpu_percent(interval=None)
+        # Svuota i SYN campionati (NO_WAKEUP non sveglia epoll)
+        if USE_RINGBUF:
+            b.ring_buffer_consume()
+        else:
+            b.perf_buffer_consume()
+
+        # Costo XDP misurato dal kernel: ns/pacchetto e quota di CPU
+        ns_per_pkt, cpu_usage = run_stats.sample()
 
-        # Lettura contatori BPF
-        syn_key = 0
-        syn_total = b["stats_map"][syn_key].value
-        blocked = len(b["ip_blocked_map"])
+        # Lettura contatori BPF (ogni lookup per-CPU legge tutte le CPU)
+        syn_total = b["stats_map"].sum(0).value
+        blocked = b["stats_map"].sum(1).value
 
         # Calcolo OPS/PPS
         delta_syn = syn_total - prev_syn
@@ -177,6 +277,7 @@ try:
         syn_counts.append(syn_total)
         blocked_counts.append(blocked)
         cpu_usages.append(cpu_usage)
+        ns_per_pkts.append(ns_per_pkt)
         pps_rates.append(pps)
 
 except KeyboardInterrupt:
@@ -188,36 +289,43 @@ except KeyboardInterrupt:
     success_rate = (accepted / syn_counts[-1] * 100) if syn_counts[-1] > 0 else 0
 
     df = pd.DataFrame({
-        "Metric": ["SYN Total", "SYN Blocked", "SYN Accepted", "Success Rate (%)", "Avg CPU (%)", "Avg PPS"],
+        "Metric": ["SYN Total", "SYN Blocked", "SYN Accepted", "Success Rate (%)", "Avg XDP CPU (%)", "Avg ns/pkt", "Avg PPS"],
         "Value": [syn_counts[-1], blocked_counts[-1], accepted, success_rate,
-                  sum(cpu_usages)/len(cpu_usages), sum(pps_rates)/len(pps_rates)]
+                  sum(cpu_usages)/len(cpu_usages), run_stats.avg_ns_per_pkt(),
+                  sum(pps_rates)/len(pps_rates)]
     })
 
     print("\n=== Risultati Firewall ===")
     print(df.to_string(index=False))
 
+    print("\n=== Top sorgenti SYN (campioni 1/64) ===")
+    for ip, count in syn_sources.most_common(5):
+        print(f"{ip_to_str(ip)}: {count}")
+    print(f"IP bloccati notificati: {blocked_events}")
+
     # --- Grafici temporali ---
-    plt.figure()
+    plt.figure(dpi=80)
     plt.plot(timestamps, syn_counts, label="SYN Total")
     plt.plot(timestamps, blocked_counts, label="SYN Blocked")
     plt.xlabel("Time (s)")
     plt.ylabel("Count")
     plt.title("SYN Packets Over Time")
     plt.legend()
-    plt.show()
-
-    plt.figure()
-    plt.plot(timestamps, cpu_usages, label="CPU Usage (%)")
-    plt.xlabel("Time (s)")
-    plt.ylabel("CPU %")
-    plt.title("CPU Usage Over Time")
-    plt.legend()
-    plt.show()
-
-    plt.figure()
+    plt.savefig("xdp_firewall_syn_over_time.png")
+
+    if run_stats.valid:
+        plt.figure(dpi=80)
+        plt.plot(timestamps, ns_per_pkts, label="XDP run time (ns/pkt)")
+        plt.xlabel("Time (s)")
+        plt.ylabel("ns/pkt")
+        plt.title("XDP Cost per Packet")
+        plt.legend()
+        plt.savefig("xdp_firewall_ns_per_packet.png")
+
+    plt.figure(dpi=80)
     plt.plot(timestamps, pps_rates, label="Packets/s")
     plt.xlabel("Time (s)")
     plt.ylabel("PPS")
     plt.title("Throughput (SYN/sec)")
     plt.legend()
-    plt.show()
+    plt.savefig("xdp_firewall_throughput.png")